@@ -17,25 +17,18 @@ except Exception as e:
     print(f"Warning: torch import failed with error: {e}", file=sys.stderr)
 
 import streamlit as st
-import spacy
-import string
-import numpy as np
-from collections import Counter
 import psycopg2
-import json
 from sklearn.metrics.pairwise import cosine_similarity
 import plotly.graph_objects as go
 
-from textblob import TextBlob
-from nltk.sentiment.vader import SentimentIntensityAnalyzer
-import nltk
-nltk.download('vader_lexicon')
+from sentence_transformers import util
 
-import PyPDF2
-import docx
-
-from transformers import AutoTokenizer
-from sentence_transformers import SentenceTransformer, util
+from styloguard_core import (
+    get_db_connection, extract_text, analyze_text,
+    student_exists, insert_student, essay_exists, insert_essay, fetch_student_essays,
+    mask_content, embed_text, text_key, fetch_cached,
+)
+from model_registry import ModelRegistry
 
 # =======================
 # ✨ Apply Custom CSS for ASU Theme
@@ -97,202 +90,38 @@ section[data-testid="stSidebar"] {
 # =======================
 # Shared Resources
 # =======================
-nlp = spacy.load("en_core_web_sm")
-EMOTION_WORDS = {
-    "happy","joy","delight","pleasure","elated","excited","cheerful","content",
-    "sad","sorrow","grief","mourn","depressed","gloomy","melancholy",
-    "angry","anger","furious","irate","annoyed",
-    "fear","fright","dread","scared","terrified",
-    "disgust","repulsion","revulsion","dislike",
-    "surprise","astonishment","amazement",
-    "trust","confidence","admiration"
-}
-
-# (Database helpers, file extraction, feature extraction, SBERT embedding functions)
-def get_db_connection():
-    return psycopg2.connect(
-        dbname="approj", user="postgres", password="shark",
-        host="localhost", port="5432"
-    )
-
-# ——————————————
-# File Parsing
-# ——————————————
 def extract_text_from_file(uploaded_file):
-    text = ""
-    if uploaded_file.type == "application/pdf":
-        reader = PyPDF2.PdfReader(uploaded_file)
-        for page in reader.pages:
-            text += page.extract_text() or ""
-    elif uploaded_file.type in (
-        "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-        "application/msword"
-    ):
-        docx_doc = docx.Document(uploaded_file)
-        for para in docx_doc.paragraphs:
-            text += para.text + "\n"
-    else:
+    try:
+        return extract_text(uploaded_file, uploaded_file.type)
+    except ValueError:
         st.error("Unsupported file type.")
-    return text.strip()
+        return ""
 
-# ——————————————
-# Stylometric Feature Extraction
-# ——————————————
-def count_syllables(word):
-    w = word.lower()
-    vowels = "aeiouy"
-    n, prev = 0, False
-    for c in w:
-        if c in vowels and not prev:
-            n += 1
-            prev = True
-        elif c not in vowels:
-            prev = False
-    if w.endswith("e") and n > 1:
-        n -= 1
-    return n or 1
-
-def compute_readability(sentences, words, syllables):
-    if sentences == 0 or words == 0:
-        return 0
-    wps = words/sentences
-    spw = syllables/words
-    score = 206.835 - 1.015*wps - 84.6*spw
-    return round(max(score,0),2)
-
-def compute_gunning_fog(words, sentences, complex_words):
-    if words==0 or sentences==0:
-        return 0
-    return round(0.4*((words/sentences)+100*(complex_words/words)),2)
-
-def compute_idio(doc):
-    stops = [t.text.lower() for t in doc if t.is_alpha and t.is_stop]
-    bi = list(zip(stops, stops[1:]))
-    cnt = Counter(bi)
-    rep = [(bg,c) for bg,c in cnt.items() if c>=2]
-    return len(rep), [f"{a} {b}: {c}" for (a,b),c in rep]
-
-def analyze_text(text):
-    doc = nlp(text)
-    sents = list(doc.sents)
-    ns = len(sents)
-    words = [t.text for t in doc if t.is_alpha]
-    nw = len(words)
-    uw = len(set(w.lower() for w in words))
-    ttr = uw/nw if nw else 0
-    avg_wlen = round(sum(len(w) for w in words)/nw,2) if nw else 0
-    freqs = Counter(w.lower() for w in words)
-    hapax = sum(1 for _,c in freqs.items() if c==1)
-    hapax_rate = hapax/nw if nw else 0
-    punct = sum(1 for t in doc if t.text in string.punctuation)
-    noun_chunks = len(list(doc.noun_chunks))
-    pos_counts = {p:0 for p in ["VERB","NOUN","ADJ","CCONJ","ADV","PRON"]}
-    for t in doc:
-        if t.pos_ in pos_counts:
-            pos_counts[t.pos_] += 1
-    idio_cnt, idio_list = compute_idio(doc)
-    syll = sum(count_syllables(t.text) for t in doc if t.is_alpha)
-    gre = compute_readability(ns,nw,syll)
-    comp_words = sum(1 for t in doc if t.is_alpha and count_syllables(t.text)>2)
-    gfn = compute_gunning_fog(nw,ns,comp_words)
-    emo = sum(1 for t in doc if t.lemma_.lower() in EMOTION_WORDS)
-    blob = TextBlob(text)
-    pol = round(blob.sentiment.polarity,2)
-    sia = SentimentIntensityAnalyzer()
-    vad = round(sia.polarity_scores(text)["compound"],2)
-    fp = {"i","me","my","mine","we","us","our","ours"}
-    fp_cnt = sum(1 for t in doc if t.lower_ in fp)
-    pers_ent = sum(1 for ent in doc.ents if ent.label_=="PERSON")
-
-    return {
-        "Total Word Count":         {"Count": nw,   "Note": "Total word count for the essay."},
-        "Unique Word Count":        {"Count": uw,    "Note":"Total distinct words. Range: 0 to total words; higher implies broader vocabulary."},
-        "Average Word Length":      {"Value": avg_wlen, "Note":"Mean number of characters per word; larger values suggest more complex vocabulary."},
-        "Type-Token Ratio":         {"Value": round(ttr,2), "Note":"The ratio of number of unique words to the number of total words (0-1). Higher value suggests greater lexical diversity"},
-        "Hapax Legomenon Rate":     {"Value": round(hapax_rate,2),"Note":"Proportion of words appearing once (0–1); closer to 1 indicates more unique words."},
-        "Stopword Count":           {"Count": sum(1 for t in doc if t.is_stop),"Note":"Number of common function words; higher value suggests that there are more words than necessary."},
-        "Contraction Count":        {"Count": sum(1 for t in doc if "'" in t.text),"Note":"Number of contractions (e.g., don't, I'm); may signal informal style."},
-        "Emotion Word Count":       {"Count": emo,"Note":"Frequency of emotion-related words from an expanded lexicon."},
-        "Polarity (TextBlob)":      {"Value": pol,"Note":"Sentiment polarity between -1 (very negative) and +1 (very positive), with 0 as neutral."},
-        "Vader Compound":           {"Value": vad,"Note":"Sentiment polarity from Vader Compound between -1 (very negative) and +1 (very positive), with 0 as neutral."},
-        "GunningFog Score":         {"Score": gfn,"Note":"Readability complexity; typically from ~5 (easy) to 20+ (difficult)."},
-        "Flesch Reading Ease":      {"Value": gre,"Note":"Readability on a scale from 0 to 100; higher scores indicate easier text."},
-        "First Person Count":       {"Count": fp_cnt,"Note":"Count of first-person pronouns (e.g., I, we); higher may indicate personal style."},
-        "Person Entities":          {"Count": pers_ent,"Note":"Number of entities tagged as PERSON."},
-        "Words per Sentence":       {"Average": round(nw/ns,2) if ns else 0,"Note":"Average count of words per sentence."},
-        "Sentence Structure":       {"Sentence Length Variance": round(np.var([len([t for t in s if t.is_alpha]) for s in sents]),2),"Note":"Variance in sentence lengths; higher values indicate greater variability."},
-        "Punctuation Usage":        {"Count": punct,"Note":"Total number of punctuation marks."},
-        "Topics and Phrases":       {"Noun Chunks": noun_chunks,"Note":"Count of noun phrases, reflecting descriptive detail."},
-        "POS Distribution":         {"Counts": pos_counts,"Note":"Frequencies of various parts of speech (e.g., VERB, NOUN, ADJ, etc.)."},
-        "Idiosyncratic Expressions":{"Repeated Bigrams Count": idio_cnt,"Repeated Bigrams List": idio_list,"Note":"Count and list of repeated function-word bigrams; higher counts indicate recurring stylistic patterns."},
-    }
+@st.cache_resource
+def load_registry():
+    # Loaded (and warmed up) once per server process at startup; hot-reloads
+    # when a new bundle is published
+    return ModelRegistry()
 
-def extract_feature_vector(feat):
-    v = []
-    order = [
-        ("Unique Word Count","Count"),
-        ("Average Word Length","Value"),
-        ("Type-Token Ratio","Value"),
-        ("Hapax Legomenon Rate","Value"),
-        ("Stopword Count","Count"),
-        ("Contraction Count","Count"),
-        ("Emotion Word Count","Count"),
-        ("Polarity (TextBlob)","Value"),
-        ("Vader Compound","Value"),
-        ("GunningFog Score","Score"),
-        ("Flesch Reading Ease","Value"),
-        ("First Person Count","Count"),
-        ("Person Entities","Count"),
-        ("Words per Sentence","Average"),
-        ("Sentence Structure","Sentence Length Variance"),
-        ("Punctuation Usage","Count"),
-        ("Topics and Phrases","Noun Chunks"),
-        ("Idiosyncratic Expressions","Repeated Bigrams Count"),
-    ]
-    for feat_name, subkey in order:
-        v.append(feat[feat_name].get(subkey,0))
-    # POS
-    for p in ["VERB","NOUN","ADJ","CCONJ","ADV","PRON"]:
-        v.append(feat["POS Distribution"]["Counts"].get(p,0))
-    arr = np.array(v,dtype=float)
-    norm = np.linalg.norm(arr)
-    return arr/norm if norm>0 else arr
-
-def student_exists(conn, sid):
-    cur = conn.cursor()
-    cur.execute("SELECT 1 FROM Students WHERE student_id=%s",(sid,))
-    ok = cur.fetchone() is not None
-    cur.close()
-    return ok
-
-def insert_student(conn, sid,name,email):
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO Students(student_id,name,email) VALUES(%s,%s,%s) ON CONFLICT DO NOTHING",
-        (sid,name,email)
-    )
-    conn.commit(); cur.close()
-
-def essay_exists(conn,sid,text):
-    cur = conn.cursor()
-    cur.execute("SELECT 1 FROM Essays WHERE student_id=%s AND essay_text=%s",(sid,text))
-    ok=cur.fetchone() is not None
-    cur.close()
-    return ok
-
-def insert_essay(conn,sid,text,style):
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO Essays(student_id,essay_text,fingerprint) VALUES(%s,%s,%s)",
-        (sid,text,json.dumps({"style_index":style}))
-    )
-    conn.commit(); cur.close()
+registry = load_registry()
+
+def lookup_cached(text, model_version=None):
+    # Features/embedding precomputed by ingest_daemon.py, or None if the text
+    # hasn't been ingested (or the database is unreachable). The embedding is
+    # None unless it was computed by model_version.
+    try:
+        conn = get_db_connection()
+        try:
+            return fetch_cached(conn, text_key(text), model_version)
+        finally:
+            conn.close()
+    except psycopg2.Error:
+        return None
+
+def cached_analyze_text(text):
+    hit = lookup_cached(text)
+    return hit[0] if hit else analyze_text(text)
 
-def fetch_student_essays(conn,sid):
-    cur = conn.cursor()
-    cur.execute("SELECT essay_text FROM Essays WHERE student_id=%s",(sid,))
-    rows = cur.fetchall(); cur.close()
-    return [r[0] for r in rows]
 # =======================
 # Navigation
 # =======================
@@ -435,7 +264,7 @@ elif page=="Direct Analysis":
 
     if st.button("Analyze"):
         if sid and name and email and txt.strip():
-            feats = analyze_text(txt)
+            feats = cached_analyze_text(txt)
             st.write("### Analysis Report for Writing Style")
             for k,v in feats.items():
                 st.write(f"**{k}:**")
@@ -451,7 +280,7 @@ elif page=="Direct Analysis":
             else:
                 st.write("Student exists.")
             if not essay_exists(conn,sid,txt):
-                insert_essay(conn,sid,txt,analyze_text(txt)); st.write("Essay saved.")
+                insert_essay(conn,sid,txt,cached_analyze_text(txt)); st.write("Essay saved.")
             else:
                 st.write("Essay already in DB.")
             conn.close()
@@ -512,8 +341,8 @@ elif page=="Feature Comparison":
 
     if st.button("Compute Feature Similarity"):
         if ref.strip() and test.strip():
-            f1 = analyze_text(ref)
-            f2 = analyze_text(test)
+            f1 = cached_analyze_text(ref)
+            f2 = cached_analyze_text(test)
             # raw per-feature sim
             raw = {}
             for k in f1:
@@ -570,55 +399,25 @@ else:
     Content words are masked; similarity is computed via a fine-tuned SBERT model.
     """)
 
-    @st.cache_resource
-    def load_models():
-        nlp_m = spacy.load("en_core_web_sm")
-        sbert = SentenceTransformer("fine_tuned_triplet_model")
-        tok = AutoTokenizer.from_pretrained(
-            "sentence-transformers/all-MiniLM-L6-v2", use_fast=True
-        )
-        return nlp_m, sbert, tok
-
-    nlp3, model3, tokenizer3 = load_models()
-    CONTENT_POS = {"NOUN","VERB","PROPN","ADJ","ADV"}
-
-    def mask_content(text):
-        doc = nlp3(text)
-        return " ".join(f"<{t.pos_}>" if t.pos_ in CONTENT_POS else t.text for t in doc)
-
-    def embed_text(text, stride=50):
-        max_len = tokenizer3.model_max_length
-        ids = tokenizer3(text, return_tensors="pt", truncation=False)["input_ids"][0]
-        total = len(ids)
-        embs = []
-        i = 0
-
+    def embed_with_progress(bundle, text):
         with st.spinner("Embedding text..."):
             progress = st.progress(0)
-            while i < total:
-                j = min(i + max_len, total)
-                chunk = tokenizer3.decode(ids[i:j], skip_special_tokens=True)
-                emb = model3.encode(
-                    chunk, convert_to_tensor=True,
-                    truncation=True, max_length=max_len
-                )
-                embs.append(emb.cpu().numpy())
-                i += max_len - stride
-                progress.progress(min(i / total, 1.0))  # update progress bar
+            emb = embed_text(bundle.model, bundle.tokenizer, text, progress=progress.progress)
             progress.empty()  # remove the progress bar when done
+        return emb
 
-        if not embs:
-            return model3.encode(
-                text, convert_to_tensor=True,
-                truncation=True, max_length=max_len
-            ).cpu().numpy()
-        return np.mean(np.vstack(embs), axis=0)
-
+    def masked_embedding(bundle, text):
+        hit = lookup_cached(text, bundle.version)
+        if hit and hit[1] is not None:
+            return hit[1]
+        return embed_with_progress(bundle, mask_content(text))
 
     def compute_similarity(a, b):
-        v1 = embed_text(mask_content(a))
-        v2 = embed_text(mask_content(b))
-        return util.cos_sim(v1, v2).item()
+        # Both essays must be embedded by the same model version
+        bundle = registry.current()
+        v1 = masked_embedding(bundle, a)
+        v2 = masked_embedding(bundle, b)
+        return util.cos_sim(v1, v2).item(), bundle.version
 
     st.header("Reference Essay")
     m = st.selectbox("Method", ["Paste text", "Upload file"], key="rf")
@@ -646,11 +445,12 @@ else:
 
     if st.button("Compute Similarity"):
         if ref.strip() and test.strip():
-            score = compute_similarity(ref, test)
+            score, version = compute_similarity(ref, test)
             if score >= 0.9:
                 st.success(f"**Stylometric Similarity:** {score:.3f}")
             else:
                 st.error(f"**Stylometric Similarity:** {score:.3f}")
+            st.caption(f"Model version: {version}")
         else:
             st.error("Both essays required.")
 
@@ -0,0 +1,170 @@
+# evaluate.py
+#
+# Offline evaluation of the stylometric similarity model. Samples labelled
+# same-author / different-author pairs from an essays.csv-style corpus (the
+# format train.py reads), then sweeps window size, stride, window pooling and
+# inference backend. For every configuration it reports ROC-AUC, EER, the best
+# threshold (and accuracy there and at the app's 0.9 cutoff) next to
+# throughput and single-essay latency, so the cheapest configuration that
+# keeps accuracy can be picked with data.
+
+import time
+import random
+import itertools
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from sklearn.metrics import roc_auc_score, roc_curve
+from sentence_transformers import SentenceTransformer
+
+from triplet_data import spool_to_parquet, AuthorIndex, read_essays
+from styloguard_core import mask_content, encode_windows, pool_windows
+from model_registry import ModelRegistry, warm_up
+
+# SETTINGS
+DATA_PATH       = "essays.csv"            # .csv or .parquet with 'essay','authors'
+SPOOL_PATH      = "essays.spool.parquet"
+N_PAIRS         = 500                     # per class (same / different author)
+SEED            = 13
+APP_THRESHOLD   = 0.9                     # cutoff currently used by the app
+LATENCY_SAMPLES = 20                      # essays timed one at a time
+WINDOWS         = [128, 256, 512]         # tokens per window
+STRIDES         = [0, 50, 128]            # tokens of overlap between windows
+POOLINGS        = ["mean", "max", "first", "len_weighted"]
+BACKENDS        = ["torch", "onnx"]       # SentenceTransformer(backend=...)
+OUT_CSV         = "eval_results.csv"
+
+# ——————————————
+# Labelled pairs
+# ——————————————
+def sample_pairs(index, n_pairs, rng):
+    eligible = [a for a, offs in enumerate(index.by_author) if len(offs) >= 2]
+    if not eligible or len(index.authors) < 2:
+        raise ValueError("Need at least two authors and one author with two essays.")
+    possible = sum(len(index.by_author[a]) * (len(index.by_author[a]) - 1) // 2 for a in eligible)
+    pairs = set()
+    while len(pairs) < min(n_pairs, possible):
+        offs = index.by_author[rng.choice(eligible)]
+        a, b = sorted(rng.sample(range(len(offs)), 2))
+        pairs.add((int(offs[a]), int(offs[b]), 1))
+    sizes = np.array([len(o) for o in index.by_author])
+    cross = int((sizes.sum() ** 2 - (sizes ** 2).sum()) // 2)
+    same = len(pairs)
+    while len(pairs) < same + min(n_pairs, cross):
+        x, y = rng.sample(range(len(index.authors)), 2)
+        ox, oy = index.by_author[x], index.by_author[y]
+        a, b = int(ox[rng.randrange(len(ox))]), int(oy[rng.randrange(len(oy))])
+        # Unordered, like the same-author pairs, so (a, b) and (b, a) aren't both drawn
+        pairs.add((min(a, b), max(a, b), 0))
+    return sorted(pairs)
+
+# ——————————————
+# Metrics
+# ——————————————
+def score_pairs(labels, scores):
+    labels, scores = np.asarray(labels), np.asarray(scores)
+    fpr, tpr, thr = roc_curve(labels, scores)
+    fnr = 1 - tpr
+    k = np.nanargmin(np.abs(fnr - fpr))
+    best = np.argmax(tpr - fpr)  # Youden's J
+    best_thr = float(thr[best])
+    return {
+        "roc_auc":      round(roc_auc_score(labels, scores), 4),
+        "eer":          round(float((fpr[k] + fnr[k]) / 2), 4),
+        "best_thr":     round(best_thr, 4),
+        "acc_best":     round(float(np.mean((scores >= best_thr) == labels)), 4),
+        "acc_app_thr":  round(float(np.mean((scores >= APP_THRESHOLD) == labels)), 4),
+    }
+
+def cosine(u, v):
+    return float(np.dot(u, v) / (np.linalg.norm(u) * np.linalg.norm(v) or 1.0))
+
+# ——————————————
+# Sweep
+# ——————————————
+def load_backend(backend, bundle):
+    if backend == "torch":
+        model = bundle.model
+    else:
+        model = SentenceTransformer(bundle.path, backend=backend, local_files_only=True)
+    # Keep session init / kernel selection out of the first configuration's timings
+    warm_up(model, bundle.tokenizer)
+    return model
+
+def evaluate_config(model, tok, offsets, masked, pairs, window, stride):
+    # Pooling only combines the window embeddings, so encode once per
+    # (window, stride) and score every pooling from the same windows. Encoding
+    # dominates the cost; all poolings report the same throughput and latency.
+    texts = [masked[o] for o in offsets]
+    # The Transformer module truncates at max_seq_length; let it see the full window
+    model.max_seq_length = min(window, model[0].auto_model.config.max_position_embeddings)
+
+    t0 = time.perf_counter()
+    windows = encode_windows(model, tok, texts, stride=stride, window=window)
+    elapsed = time.perf_counter() - t0
+
+    lat = []
+    for text in texts[:LATENCY_SAMPLES]:
+        t = time.perf_counter()
+        encode_windows(model, tok, [text], stride=stride, window=window)
+        lat.append((time.perf_counter() - t) * 1000)
+    timing = {
+        "essays_per_s":   round(len(texts) / elapsed, 2),
+        "latency_p50_ms": round(float(np.percentile(lat, 50)), 1),
+        "latency_p95_ms": round(float(np.percentile(lat, 95)), 1),
+    }
+
+    labels = [p[2] for p in pairs]
+    rows = {}
+    for pooling in POOLINGS:
+        vec = dict(zip(offsets, pool_windows(*windows, len(texts), pooling)))
+        rows[pooling] = score_pairs(labels, [cosine(vec[a], vec[b]) for a, b, _ in pairs])
+        rows[pooling].update(timing)
+    return rows
+
+def main():
+    rng = random.Random(SEED)
+    spool_to_parquet(DATA_PATH, SPOOL_PATH)
+    index = AuthorIndex(SPOOL_PATH)
+    pairs = sample_pairs(index, N_PAIRS, rng)
+    offsets = sorted({o for a, b, _ in pairs for o in (a, b)})
+    print(f"Evaluating {len(pairs)} pairs over {len(offsets)} essays.")
+
+    # Masking doesn't depend on the configuration; do it once
+    texts = read_essays(pq.ParquetFile(index.path), index, offsets)
+    masked = {o: mask_content(texts[o]) for o in offsets}
+
+    bundle = ModelRegistry().current()
+    tok = bundle.tokenizer
+    print(f"Model version: {bundle.version}")
+    rows = []
+    for backend in BACKENDS:
+        try:
+            model = load_backend(backend, bundle)
+        except Exception as e:
+            print(f"Skipping backend '{backend}': {type(e).__name__}: {e}")
+            continue
+        # evaluate_config changes max_seq_length; the torch model is the shared bundle's
+        max_seq_length = model.max_seq_length
+        try:
+            for window, stride in itertools.product(WINDOWS, STRIDES):
+                if stride >= window:
+                    continue
+                scores = evaluate_config(model, tok, offsets, masked, pairs, window, stride)
+                for pooling, metrics in scores.items():
+                    row = {"model_version": bundle.version, "backend": backend, "window": window, "stride": stride, "pooling": pooling}
+                    row.update(metrics)
+                    print(row)
+                    rows.append(row)
+        finally:
+            model.max_seq_length = max_seq_length
+
+    results = pd.DataFrame(rows).sort_values(["roc_auc", "essays_per_s"], ascending=False)
+    results.to_csv(OUT_CSV, index=False)
+    print(results.to_string(index=False))
+    print(f"Results written to '{OUT_CSV}'")
+
+
+if __name__ == "__main__":
+    main()
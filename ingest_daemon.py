@@ -0,0 +1,301 @@
+# ingest_daemon.py
+#
+# Background ingestion: polls a submissions folder, and for every new PDF/DOCX
+# runs text extraction, stylometric analysis, masking and SBERT embedding in
+# batched worker processes. Results are written to AnalysisCache (and to
+# Students/Essays when the submission has a student sidecar), so the app's
+# pages only have to look them up.
+#
+# Submission layout:
+#   submissions/inbox/essay1.pdf
+#   submissions/inbox/essay1.json   (optional) {"student_id": 1, "name": "...", "email": "..."}
+# Processed files are moved to submissions/done/, failures to submissions/failed/,
+# renamed <timestamp>_essay1.pdf so a later upload with the same name can't
+# overwrite them. A sidecar that arrives after its document was processed
+# re-queues it; one with no document at all is moved to failed/ after
+# ORPHAN_SECONDS.
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import psycopg2
+import torch
+
+from model_registry import ModelRegistry, current_version
+from styloguard_core import (
+    FILE_TYPES, get_db_connection, extract_text, analyze_text,
+    student_exists, insert_student, essay_exists, insert_essay,
+    mask_content, embed_texts,
+    text_key, ensure_cache_table, fetch_cached, store_cached,
+)
+
+# SETTINGS
+INBOX_DIR      = os.path.join("submissions", "inbox")
+DONE_DIR       = os.path.join("submissions", "done")
+FAILED_DIR     = os.path.join("submissions", "failed")
+POLL_SECONDS   = 5
+SETTLE_SECONDS = 2   # skip files modified this recently (still being copied)
+ORPHAN_SECONDS = 3600  # sidecars with no document after this long go to failed/
+BATCH_SIZE     = 8   # submissions per worker task
+NUM_WORKERS    = max(1, (os.cpu_count() or 2) - 1)
+
+# done/ and failed/ entries: <timestamp>_<original name>
+ARCHIVE_NAME = re.compile(r"^\d{8}-\d{6}-\d{6}_(.+)$")
+
+# Connection-level failures: reconnect and leave the file in the inbox
+RETRYABLE = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+# ——————————————
+# Worker process
+# ——————————————
+_registry = None
+_conn = None
+
+def _init_worker():
+    # Each worker loads (and warms up) the model once; the DB connection is
+    # opened lazily so a database outage can't break the pool
+    global _registry
+    # Split the cores between workers instead of each spawning cpu_count threads
+    torch.set_num_threads(max(1, (os.cpu_count() or 2) // NUM_WORKERS))
+    _registry = ModelRegistry()
+
+def _lookup(key, version):
+    global _conn
+    for attempt in range(2):
+        try:
+            if _conn is None or _conn.closed:
+                _conn = get_db_connection()
+                _conn.autocommit = True  # read-only lookups; don't sit idle in a transaction
+            return fetch_cached(_conn, key, version)
+        except RETRYABLE:
+            _conn = None
+            if attempt:
+                raise
+
+def process_batch(paths):
+    # One bundle per batch, so a hot reload never mixes versions within it
+    bundle = _registry.current()
+    results, todo = [], []
+    for path in paths:
+        try:
+            mime = FILE_TYPES[os.path.splitext(path)[1].lower()]
+            with open(path, "rb") as fh:
+                text = extract_text(fh, mime)
+            if not text:
+                raise ValueError("No text could be extracted.")
+            key = text_key(text)
+            hit = _lookup(key, bundle.version)
+            res = {"path": path, "text": text, "key": key, "model_version": bundle.version}
+            if hit:
+                res["features"] = hit[0]
+            if not hit or hit[1] is None:
+                todo.append(res)
+            results.append(res)
+        except RETRYABLE as e:
+            results.append({"path": path, "retry": f"{type(e).__name__}: {e}"})
+        except Exception as e:
+            results.append({"path": path, "error": f"{type(e).__name__}: {e}"})
+
+    masked = []
+    for res in list(todo):
+        try:
+            if "features" not in res:
+                res["features"] = analyze_text(res["text"])
+            masked.append(mask_content(res["text"]))
+        except Exception as e:
+            res["error"] = f"{type(e).__name__}: {e}"
+            todo.remove(res)
+    if todo:
+        try:
+            embs = embed_texts(bundle.model, bundle.tokenizer, masked)
+        except Exception as e:
+            # One bad batch (e.g. out of memory) fails its files, not the worker
+            for res in todo:
+                res["error"] = f"{type(e).__name__}: {e}"
+            return results
+        for res, emb in zip(todo, embs):
+            res["embedding"] = [float(x) for x in emb]
+    return results
+
+# ——————————————
+# Main process
+# ——————————————
+def _sidecar(path):
+    return os.path.splitext(path)[0] + ".json"
+
+def _find_document(directory, stem):
+    for ext in FILE_TYPES:
+        path = os.path.join(directory, stem + ext)
+        if os.path.exists(path):
+            return path
+    return None
+
+def scan_inbox():
+    now = time.time()
+    found, sidecars = [], []
+    for entry in os.scandir(INBOX_DIR):
+        if not entry.is_file():
+            continue
+        ext = os.path.splitext(entry.name)[1].lower()
+        if ext == ".json":
+            sidecars.append(entry.path)
+            continue
+        if ext not in FILE_TYPES:
+            continue
+        if now - entry.stat().st_mtime < SETTLE_SECONDS:
+            continue
+        # The sidecar has to be complete too, or the student rows are lost
+        side = _sidecar(entry.path)
+        if os.path.exists(side) and now - os.path.getmtime(side) < SETTLE_SECONDS:
+            continue
+        found.append(entry.path)
+    for side in sidecars:
+        adopt_sidecar(side, now)
+    return sorted(found)
+
+def _archived_without_sidecar(directory, stem):
+    # Archived documents originally named <stem>.<ext> that were processed
+    # without a sidecar, oldest first
+    found = []
+    for name in os.listdir(directory):
+        m = ARCHIVE_NAME.match(name)
+        if not m:
+            continue
+        orig_stem, ext = os.path.splitext(m.group(1))
+        path = os.path.join(directory, name)
+        if orig_stem == stem and ext.lower() in FILE_TYPES and not os.path.exists(_sidecar(path)):
+            found.append(path)
+    return sorted(found)
+
+def adopt_sidecar(side, now):
+    # A sidecar whose document is not in the inbox arrived late or is orphaned
+    stem = os.path.splitext(os.path.basename(side))[0]
+    if _find_document(INBOX_DIR, stem) or now - os.path.getmtime(side) < SETTLE_SECONDS:
+        return
+    done = _archived_without_sidecar(DONE_DIR, stem)
+    if done:
+        # Re-queue the latest such document under its original name; its
+        # analysis is cached, so this only adds the Students/Essays rows
+        doc = done[-1]
+        name = ARCHIVE_NAME.match(os.path.basename(doc)).group(1)
+        print(f"Late sidecar {os.path.basename(side)}; re-queueing {os.path.basename(doc)}.")
+        shutil.move(doc, os.path.join(INBOX_DIR, name))
+    elif _archived_without_sidecar(FAILED_DIR, stem) or now - os.path.getmtime(side) >= ORPHAN_SECONDS:
+        print(f"Orphaned sidecar {os.path.basename(side)}; moving to '{FAILED_DIR}'.", file=sys.stderr)
+        _move(side, FAILED_DIR)
+
+def _move(path, dest_dir):
+    # Document and sidecar share the prefix, so they still pair up in dest_dir
+    stamp = f"{datetime.now():%Y%m%d-%H%M%S-%f}"
+    for p in dict.fromkeys((path, _sidecar(path))):
+        if os.path.exists(p):
+            shutil.move(p, os.path.join(dest_dir, f"{stamp}_{os.path.basename(p)}"))
+
+def read_sidecar(side):
+    with open(side) as fh:
+        student = json.load(fh)
+    if not isinstance(student, dict):
+        raise ValueError(f"Sidecar must be a JSON object, got {type(student).__name__}.")
+    sid = student.get("student_id")
+    if isinstance(sid, bool) or not isinstance(sid, (int, str)):
+        raise ValueError(f"Invalid student_id {sid!r}.")
+    return int(sid), student
+
+def store_result(conn, res):
+    if "embedding" in res:
+        store_cached(conn, res["key"], res["features"], res["embedding"], res["model_version"])
+    side = _sidecar(res["path"])
+    if os.path.exists(side):
+        sid, student = read_sidecar(side)
+        if not student_exists(conn, sid):
+            insert_student(conn, sid, student.get("name"), student.get("email"))
+        if not essay_exists(conn, sid, res["text"]):
+            insert_essay(conn, sid, res["text"], res["features"])
+
+def _reconnect(conn):
+    # Keeps the dead connection if the database is still down; the next
+    # store attempt fails as retryable again and comes back here
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
+    try:
+        return get_db_connection()
+    except RETRYABLE:
+        return conn
+
+def handle_results(conn, results):
+    # Returns the (possibly new) connection and whether anything must be retried
+    retry = False
+    for res in results:
+        name = os.path.basename(res["path"])
+        if "error" not in res and "retry" not in res:
+            try:
+                store_result(conn, res)
+            except RETRYABLE as e:
+                res["retry"] = f"{type(e).__name__}: {e}"
+                conn = _reconnect(conn)
+            except (psycopg2.Error, OSError, ValueError, KeyError, TypeError) as e:
+                try:
+                    conn.rollback()
+                except RETRYABLE:
+                    conn = _reconnect(conn)
+                res["error"] = f"{type(e).__name__}: {e}"
+        if "retry" in res:
+            print(f"Will retry {name}: {res['retry']}", file=sys.stderr)
+            retry = True
+        elif "error" in res:
+            print(f"Failed {name}: {res['error']}", file=sys.stderr)
+            _move(res["path"], FAILED_DIR)
+        else:
+            print(f"Ingested {name}.")
+            _move(res["path"], DONE_DIR)
+    return conn, retry
+
+def _new_pool():
+    return ProcessPoolExecutor(max_workers=NUM_WORKERS, initializer=_init_worker)
+
+def main():
+    for d in (INBOX_DIR, DONE_DIR, FAILED_DIR):
+        os.makedirs(d, exist_ok=True)
+    conn = get_db_connection()
+    ensure_cache_table(conn)
+    # Resolve (and on first run, bootstrap) the registry before workers race for it
+    version = current_version()
+    print(f"Watching '{INBOX_DIR}' with {NUM_WORKERS} workers, model '{version}'.")
+
+    pool = _new_pool()
+    try:
+        while True:
+            pending = scan_inbox()
+            if not pending:
+                time.sleep(POLL_SECONDS)
+                continue
+            batches = [pending[i:i + BATCH_SIZE] for i in range(0, len(pending), BATCH_SIZE)]
+            retry = False
+            try:
+                for results in pool.map(process_batch, batches):
+                    conn, failed = handle_results(conn, results)
+                    retry = retry or failed
+            except BrokenProcessPool as e:
+                # A worker died (e.g. OOM); unprocessed files stay in the inbox
+                print(f"Worker pool crashed ({e}); restarting it.", file=sys.stderr)
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = _new_pool()
+                retry = True
+            if retry:
+                time.sleep(POLL_SECONDS)  # don't spin while the database is down
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+# Guarded so worker processes can import this module without starting a loop
+if __name__ == "__main__":
+    main()
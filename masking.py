@@ -0,0 +1,19 @@
+# masking.py
+#
+# Content masking shared by scoring (styloguard_core.py) and training
+# (triplet_data.py): content words are replaced by their POS tag so the
+# similarity model sees style rather than topic. Kept apart from
+# styloguard_core so DataLoader workers only load spaCy, not the app's
+# PDF/DOCX, sentiment and database dependencies.
+
+import spacy
+
+nlp = spacy.load("en_core_web_sm")
+CONTENT_POS = {"NOUN","VERB","PROPN","ADJ","ADV"}
+
+def mask_doc(doc):
+    # One implementation for scoring and training so the masks can't drift
+    return " ".join(f"<{t.pos_}>" if t.pos_ in CONTENT_POS else t.text for t in doc)
+
+def mask_content(text):
+    return mask_doc(nlp(text))
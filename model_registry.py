@@ -0,0 +1,204 @@
+# model_registry.py
+#
+# Local, versioned store for the similarity model. Each bundle is a complete
+# SentenceTransformer directory (weights, config and its own tokenizer) under
+# models/<version>/, and models/CURRENT names the live one. Bundles are loaded
+# offline, warmed up before they serve, and swapped in the background when
+# CURRENT changes, so a newly published train.py output goes live without a
+# restart. The version string is what cached embeddings are stamped with.
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from transformers import AutoTokenizer
+from sentence_transformers import SentenceTransformer
+
+BASE_DIR             = os.path.dirname(os.path.abspath(__file__))
+REGISTRY_DIR         = os.path.join(BASE_DIR, "models")
+LEGACY_MODEL_DIR     = os.path.join(BASE_DIR, "fine_tuned_triplet_model")
+CURRENT_FILE         = "CURRENT"
+MANIFEST_FILE        = "bundle.json"
+LOCK_FILE            = "publish.lock"
+LOCK_STALE_SECONDS   = 600
+RELOAD_CHECK_SECONDS = 10
+# Masked-style text, long enough to fill a whole window
+WARMUP_TEXTS = [
+    " ".join(["The <NOUN> <VERB> that the <ADJ> <NOUN> <VERB> <ADV> ."] * 64),
+    "<PROPN> <VERB> a <NOUN> .",
+]
+
+Bundle = namedtuple("Bundle", ["version", "path", "model", "tokenizer"])
+
+# ——————————————
+# Publishing
+# ——————————————
+def _hash_dir(path):
+    h = hashlib.sha256()
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames.sort()
+        for name in sorted(filenames):
+            full = os.path.join(dirpath, name)
+            h.update(os.path.relpath(full, path).replace(os.sep, "/").encode("utf-8"))
+            with open(full, "rb") as fh:
+                for block in iter(lambda: fh.read(1 << 20), b""):
+                    h.update(block)
+    return h.hexdigest()
+
+def list_versions(root=REGISTRY_DIR):
+    if not os.path.isdir(root):
+        return []
+    return sorted(
+        d for d in os.listdir(root)
+        if os.path.isfile(os.path.join(root, d, MANIFEST_FILE))
+    )
+
+def _set_current(root, version):
+    tmp = os.path.join(root, CURRENT_FILE + ".tmp")
+    with open(tmp, "w") as fh:
+        fh.write(version + "\n")
+    os.replace(tmp, os.path.join(root, CURRENT_FILE))
+
+@contextmanager
+def _publish_lock(root):
+    # Exclusive-create lock file, portable across POSIX and Windows. A lock
+    # left behind by a killed process is broken after LOCK_STALE_SECONDS.
+    os.makedirs(root, exist_ok=True)
+    path = os.path.join(root, LOCK_FILE)
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(path) > LOCK_STALE_SECONDS:
+                    os.remove(path)
+                    continue
+            except FileNotFoundError:
+                continue
+            time.sleep(0.2)
+    try:
+        os.write(fd, str(os.getpid()).encode())
+        yield
+    finally:
+        os.close(fd)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def _published(root, digest):
+    existing = [v for v in list_versions(root) if v.endswith(digest[:12])]
+    return existing[0] if existing else None
+
+def _publish_locked(src_dir, root):
+    # Caller holds the publish lock, so the digest check can't go stale
+    digest = _hash_dir(src_dir)
+    version = _published(root, digest)
+    if version is None:
+        version = f"{datetime.now(timezone.utc):%Y%m%d-%H%M%S}-{digest[:12]}"
+        dst = os.path.join(root, version)
+        tmp = f"{dst}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        shutil.copytree(src_dir, tmp)
+        with open(os.path.join(tmp, MANIFEST_FILE), "w") as fh:
+            json.dump({
+                "version": version,
+                "sha256": digest,
+                "source": os.path.abspath(src_dir),
+                "created": datetime.now(timezone.utc).isoformat(),
+            }, fh, indent=2)
+        try:
+            os.replace(tmp, dst)
+        except OSError:
+            # Destination already there (e.g. a publisher that broke a stale
+            # lock); a complete bundle counts as published
+            shutil.rmtree(tmp, ignore_errors=True)
+            if not os.path.isfile(os.path.join(dst, MANIFEST_FILE)):
+                raise
+    _set_current(root, version)
+    return version
+
+def publish(src_dir, root=REGISTRY_DIR):
+    # Copy a trained model directory into the registry and make it current.
+    # Re-publishing identical files reuses the existing version.
+    with _publish_lock(root):
+        return _publish_locked(src_dir, root)
+
+def _read_current(root):
+    path = os.path.join(root, CURRENT_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as fh:
+        return fh.read().strip()
+
+def current_version(root=REGISTRY_DIR):
+    version = _read_current(root)
+    if version:
+        return version
+    # First run: adopt the model directory shipped with the repo. Re-check
+    # under the lock in case another process bootstrapped meanwhile.
+    with _publish_lock(root):
+        return _read_current(root) or _publish_locked(LEGACY_MODEL_DIR, root)
+
+# ——————————————
+# Loading
+# ——————————————
+def warm_up(model, tok):
+    # First encode pays for lazy init and kernel selection; do it before serving
+    model.encode(
+        WARMUP_TEXTS, batch_size=len(WARMUP_TEXTS),
+        truncation=True, max_length=tok.model_max_length
+    )
+
+def load_bundle(version, root=REGISTRY_DIR):
+    path = os.path.join(root, version)
+    tok = AutoTokenizer.from_pretrained(path, use_fast=True, local_files_only=True)
+    model = SentenceTransformer(path, local_files_only=True)
+    warm_up(model, tok)
+    return Bundle(version, path, model, tok)
+
+class ModelRegistry:
+    def __init__(self, root=REGISTRY_DIR, check_every=RELOAD_CHECK_SECONDS):
+        self.root = root
+        self.check_every = check_every
+        self._lock = threading.Lock()
+        self._loading = None
+        self._bundle = load_bundle(current_version(root), root)
+        self._checked = time.monotonic()
+
+    def current(self):
+        # Never blocks on a reload: the old bundle serves until the new one is warm
+        now = time.monotonic()
+        if now - self._checked >= self.check_every:
+            self._checked = now
+            self._maybe_reload()
+        return self._bundle
+
+    def _maybe_reload(self):
+        try:
+            version = current_version(self.root)
+        except OSError:
+            return
+        with self._lock:
+            if version == self._bundle.version or self._loading:
+                return
+            self._loading = version
+        threading.Thread(target=self._reload, args=(version,), daemon=True).start()
+
+    def _reload(self, version):
+        try:
+            self._bundle = load_bundle(version, self.root)
+            print(f"Model registry: now serving '{version}'.")
+        except Exception as e:
+            print(f"Model registry: failed to load '{version}': {type(e).__name__}: {e}", file=sys.stderr)
+        finally:
+            with self._lock:
+                self._loading = None
@@ -0,0 +1,346 @@
+# styloguard_core.py
+#
+# Streamlit-free analysis helpers shared by the StyloGuard app and the
+# ingestion daemon: file parsing, stylometric features, masking, SBERT
+# embeddings, and the database helpers.
+
+import hashlib
+import string
+import numpy as np
+from collections import Counter
+import psycopg2
+import json
+
+from textblob import TextBlob
+from nltk.sentiment.vader import SentimentIntensityAnalyzer
+import nltk
+nltk.download('vader_lexicon')
+
+import PyPDF2
+import docx
+
+# Re-exported: the app and the daemon import masking from here
+from masking import nlp, CONTENT_POS, mask_doc, mask_content
+
+
+# =======================
+# Shared Resources
+# =======================
+EMOTION_WORDS = {
+    "happy","joy","delight","pleasure","elated","excited","cheerful","content",
+    "sad","sorrow","grief","mourn","depressed","gloomy","melancholy",
+    "angry","anger","furious","irate","annoyed",
+    "fear","fright","dread","scared","terrified",
+    "disgust","repulsion","revulsion","dislike",
+    "surprise","astonishment","amazement",
+    "trust","confidence","admiration"
+}
+
+def get_db_connection():
+    return psycopg2.connect(
+        dbname="approj", user="postgres", password="shark",
+        host="localhost", port="5432"
+    )
+
+# ——————————————
+# File Parsing
+# ——————————————
+PDF_TYPES = ("application/pdf",)
+DOCX_TYPES = (
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "application/msword"
+)
+# Extension -> MIME type, for files that don't come through st.file_uploader
+FILE_TYPES = {".pdf": PDF_TYPES[0], ".docx": DOCX_TYPES[0], ".doc": DOCX_TYPES[1]}
+
+def extract_text(fileobj, mime):
+    text = ""
+    if mime in PDF_TYPES:
+        reader = PyPDF2.PdfReader(fileobj)
+        for page in reader.pages:
+            text += page.extract_text() or ""
+    elif mime in DOCX_TYPES:
+        docx_doc = docx.Document(fileobj)
+        for para in docx_doc.paragraphs:
+            text += para.text + "\n"
+    else:
+        raise ValueError(f"Unsupported file type: {mime}")
+    return text.strip()
+
+# ——————————————
+# Stylometric Feature Extraction
+# ——————————————
+def count_syllables(word):
+    w = word.lower()
+    vowels = "aeiouy"
+    n, prev = 0, False
+    for c in w:
+        if c in vowels and not prev:
+            n += 1
+            prev = True
+        elif c not in vowels:
+            prev = False
+    if w.endswith("e") and n > 1:
+        n -= 1
+    return n or 1
+
+def compute_readability(sentences, words, syllables):
+    if sentences == 0 or words == 0:
+        return 0
+    wps = words/sentences
+    spw = syllables/words
+    score = 206.835 - 1.015*wps - 84.6*spw
+    return round(max(score,0),2)
+
+def compute_gunning_fog(words, sentences, complex_words):
+    if words==0 or sentences==0:
+        return 0
+    return round(0.4*((words/sentences)+100*(complex_words/words)),2)
+
+def compute_idio(doc):
+    stops = [t.text.lower() for t in doc if t.is_alpha and t.is_stop]
+    bi = list(zip(stops, stops[1:]))
+    cnt = Counter(bi)
+    rep = [(bg,c) for bg,c in cnt.items() if c>=2]
+    return len(rep), [f"{a} {b}: {c}" for (a,b),c in rep]
+
+def analyze_text(text):
+    doc = nlp(text)
+    sents = list(doc.sents)
+    ns = len(sents)
+    words = [t.text for t in doc if t.is_alpha]
+    nw = len(words)
+    uw = len(set(w.lower() for w in words))
+    ttr = uw/nw if nw else 0
+    avg_wlen = round(sum(len(w) for w in words)/nw,2) if nw else 0
+    freqs = Counter(w.lower() for w in words)
+    hapax = sum(1 for _,c in freqs.items() if c==1)
+    hapax_rate = hapax/nw if nw else 0
+    punct = sum(1 for t in doc if t.text in string.punctuation)
+    noun_chunks = len(list(doc.noun_chunks))
+    pos_counts = {p:0 for p in ["VERB","NOUN","ADJ","CCONJ","ADV","PRON"]}
+    for t in doc:
+        if t.pos_ in pos_counts:
+            pos_counts[t.pos_] += 1
+    idio_cnt, idio_list = compute_idio(doc)
+    syll = sum(count_syllables(t.text) for t in doc if t.is_alpha)
+    gre = compute_readability(ns,nw,syll)
+    comp_words = sum(1 for t in doc if t.is_alpha and count_syllables(t.text)>2)
+    gfn = compute_gunning_fog(nw,ns,comp_words)
+    emo = sum(1 for t in doc if t.lemma_.lower() in EMOTION_WORDS)
+    blob = TextBlob(text)
+    pol = round(blob.sentiment.polarity,2)
+    sia = SentimentIntensityAnalyzer()
+    vad = round(sia.polarity_scores(text)["compound"],2)
+    fp = {"i","me","my","mine","we","us","our","ours"}
+    fp_cnt = sum(1 for t in doc if t.lower_ in fp)
+    pers_ent = sum(1 for ent in doc.ents if ent.label_=="PERSON")
+
+    return {
+        "Total Word Count":         {"Count": nw,   "Note": "Total word count for the essay."},
+        "Unique Word Count":        {"Count": uw,    "Note":"Total distinct words. Range: 0 to total words; higher implies broader vocabulary."},
+        "Average Word Length":      {"Value": avg_wlen, "Note":"Mean number of characters per word; larger values suggest more complex vocabulary."},
+        "Type-Token Ratio":         {"Value": round(ttr,2), "Note":"The ratio of number of unique words to the number of total words (0-1). Higher value suggests greater lexical diversity"},
+        "Hapax Legomenon Rate":     {"Value": round(hapax_rate,2),"Note":"Proportion of words appearing once (0–1); closer to 1 indicates more unique words."},
+        "Stopword Count":           {"Count": sum(1 for t in doc if t.is_stop),"Note":"Number of common function words; higher value suggests that there are more words than necessary."},
+        "Contraction Count":        {"Count": sum(1 for t in doc if "'" in t.text),"Note":"Number of contractions (e.g., don't, I'm); may signal informal style."},
+        "Emotion Word Count":       {"Count": emo,"Note":"Frequency of emotion-related words from an expanded lexicon."},
+        "Polarity (TextBlob)":      {"Value": pol,"Note":"Sentiment polarity between -1 (very negative) and +1 (very positive), with 0 as neutral."},
+        "Vader Compound":           {"Value": vad,"Note":"Sentiment polarity from Vader Compound between -1 (very negative) and +1 (very positive), with 0 as neutral."},
+        "GunningFog Score":         {"Score": gfn,"Note":"Readability complexity; typically from ~5 (easy) to 20+ (difficult)."},
+        "Flesch Reading Ease":      {"Value": gre,"Note":"Readability on a scale from 0 to 100; higher scores indicate easier text."},
+        "First Person Count":       {"Count": fp_cnt,"Note":"Count of first-person pronouns (e.g., I, we); higher may indicate personal style."},
+        "Person Entities":          {"Count": pers_ent,"Note":"Number of entities tagged as PERSON."},
+        "Words per Sentence":       {"Average": round(nw/ns,2) if ns else 0,"Note":"Average count of words per sentence."},
+        "Sentence Structure":       {"Sentence Length Variance": round(np.var([len([t for t in s if t.is_alpha]) for s in sents]),2),"Note":"Variance in sentence lengths; higher values indicate greater variability."},
+        "Punctuation Usage":        {"Count": punct,"Note":"Total number of punctuation marks."},
+        "Topics and Phrases":       {"Noun Chunks": noun_chunks,"Note":"Count of noun phrases, reflecting descriptive detail."},
+        "POS Distribution":         {"Counts": pos_counts,"Note":"Frequencies of various parts of speech (e.g., VERB, NOUN, ADJ, etc.)."},
+        "Idiosyncratic Expressions":{"Repeated Bigrams Count": idio_cnt,"Repeated Bigrams List": idio_list,"Note":"Count and list of repeated function-word bigrams; higher counts indicate recurring stylistic patterns."},
+    }
+
+def extract_feature_vector(feat):
+    v = []
+    order = [
+        ("Unique Word Count","Count"),
+        ("Average Word Length","Value"),
+        ("Type-Token Ratio","Value"),
+        ("Hapax Legomenon Rate","Value"),
+        ("Stopword Count","Count"),
+        ("Contraction Count","Count"),
+        ("Emotion Word Count","Count"),
+        ("Polarity (TextBlob)","Value"),
+        ("Vader Compound","Value"),
+        ("GunningFog Score","Score"),
+        ("Flesch Reading Ease","Value"),
+        ("First Person Count","Count"),
+        ("Person Entities","Count"),
+        ("Words per Sentence","Average"),
+        ("Sentence Structure","Sentence Length Variance"),
+        ("Punctuation Usage","Count"),
+        ("Topics and Phrases","Noun Chunks"),
+        ("Idiosyncratic Expressions","Repeated Bigrams Count"),
+    ]
+    for feat_name, subkey in order:
+        v.append(feat[feat_name].get(subkey,0))
+    # POS
+    for p in ["VERB","NOUN","ADJ","CCONJ","ADV","PRON"]:
+        v.append(feat["POS Distribution"]["Counts"].get(p,0))
+    arr = np.array(v,dtype=float)
+    norm = np.linalg.norm(arr)
+    return arr/norm if norm>0 else arr
+
+def student_exists(conn, sid):
+    cur = conn.cursor()
+    cur.execute("SELECT 1 FROM Students WHERE student_id=%s",(sid,))
+    ok = cur.fetchone() is not None
+    cur.close()
+    return ok
+
+def insert_student(conn, sid,name,email):
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO Students(student_id,name,email) VALUES(%s,%s,%s) ON CONFLICT DO NOTHING",
+        (sid,name,email)
+    )
+    conn.commit(); cur.close()
+
+def essay_exists(conn,sid,text):
+    cur = conn.cursor()
+    cur.execute("SELECT 1 FROM Essays WHERE student_id=%s AND essay_text=%s",(sid,text))
+    ok=cur.fetchone() is not None
+    cur.close()
+    return ok
+
+def insert_essay(conn,sid,text,style):
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO Essays(student_id,essay_text,fingerprint) VALUES(%s,%s,%s)",
+        (sid,text,json.dumps({"style_index":style}))
+    )
+    conn.commit(); cur.close()
+
+def fetch_student_essays(conn,sid):
+    cur = conn.cursor()
+    cur.execute("SELECT essay_text FROM Essays WHERE student_id=%s",(sid,))
+    rows = cur.fetchall(); cur.close()
+    return [r[0] for r in rows]
+
+# ——————————————
+# Masked SBERT Embeddings
+# ——————————————
+# How per-window embeddings are combined into one essay vector
+POOLING = {
+    "mean":  lambda embs, lens: np.mean(embs, axis=0),
+    "max":   lambda embs, lens: np.max(embs, axis=0),
+    "first": lambda embs, lens: embs[0],
+    "len_weighted": lambda embs, lens: np.average(embs, axis=0, weights=lens),
+}
+
+def _windows(tok, text, stride, window=None):
+    # Overlapping token windows (model_max_length by default), decoded back to text
+    max_len = window or tok.model_max_length
+    ids = tok(text, return_tensors="pt", truncation=False)["input_ids"][0]
+    total = len(ids)
+    chunks = []
+    i = 0
+    while i < total:
+        j = min(i + max_len, total)
+        chunks.append(tok.decode(ids[i:j], skip_special_tokens=True))
+        i += max_len - stride
+    return chunks
+
+def embed_text(model, tok, text, stride=50, progress=None):
+    max_len = tok.model_max_length
+    embs = []
+    chunks = _windows(tok, text, stride)
+    for k, chunk in enumerate(chunks):
+        emb = model.encode(
+            chunk, convert_to_tensor=True,
+            truncation=True, max_length=max_len
+        )
+        embs.append(emb.cpu().numpy())
+        if progress:
+            progress((k + 1) / len(chunks))
+
+    if not embs:
+        return model.encode(
+            text, convert_to_tensor=True,
+            truncation=True, max_length=max_len
+        ).cpu().numpy()
+    return np.mean(np.vstack(embs), axis=0)
+
+def encode_windows(model, tok, texts, stride=50, batch_size=32, window=None):
+    # All windows of all texts through one encode call. Returns the window
+    # embeddings, the index of the text each came from, and window lengths.
+    max_len = window or tok.model_max_length
+    owners, chunks = [], []
+    for n, text in enumerate(texts):
+        for chunk in _windows(tok, text, stride, window) or [text]:
+            owners.append(n)
+            chunks.append(chunk)
+    embs = model.encode(
+        chunks, batch_size=batch_size, convert_to_numpy=True,
+        truncation=True, max_length=max_len
+    )
+    return embs, np.array(owners), np.array([len(c) for c in chunks], dtype=float)
+
+def pool_windows(embs, owners, lens, n_texts, pooling="mean"):
+    pool = POOLING[pooling]
+    return [pool(embs[owners == n], lens[owners == n]) for n in range(n_texts)]
+
+def embed_texts(model, tok, texts, stride=50, batch_size=32, window=None, pooling="mean"):
+    # Batched embed_text
+    if not texts:
+        return []
+    embs, owners, lens = encode_windows(model, tok, texts, stride, batch_size, window)
+    return pool_windows(embs, owners, lens, len(texts), pooling)
+
+# ——————————————
+# Precomputed Analysis Cache
+# ——————————————
+def text_key(text):
+    return hashlib.sha256(text.strip().encode("utf-8")).hexdigest()
+
+def ensure_cache_table(conn):
+    cur = conn.cursor()
+    cur.execute(
+        "CREATE TABLE IF NOT EXISTS AnalysisCache("
+        "text_hash CHAR(64) PRIMARY KEY, features JSON NOT NULL, "
+        "embedding DOUBLE PRECISION[] NOT NULL, model_version TEXT, "
+        "created_at TIMESTAMPTZ DEFAULT now())"
+    )
+    # Tables created before embeddings were versioned
+    cur.execute("ALTER TABLE AnalysisCache ADD COLUMN IF NOT EXISTS model_version TEXT")
+    # JSON keeps the report's key order, JSONB doesn't; rows already stored
+    # as JSONB have lost it, so they are dropped and recomputed on demand
+    cur.execute(
+        "SELECT data_type FROM information_schema.columns "
+        "WHERE table_schema=current_schema() AND table_name='analysiscache' AND column_name='features'"
+    )
+    if cur.fetchone()[0] == "jsonb":
+        cur.execute("DELETE FROM AnalysisCache")
+        cur.execute("ALTER TABLE AnalysisCache ALTER COLUMN features TYPE JSON USING features::json")
+    conn.commit(); cur.close()
+
+def fetch_cached(conn, key, model_version):
+    # Features don't depend on the model; the embedding is only returned if it
+    # was computed by model_version, otherwise it is None
+    cur = conn.cursor()
+    cur.execute("SELECT features, embedding, model_version FROM AnalysisCache WHERE text_hash=%s",(key,))
+    row = cur.fetchone(); cur.close()
+    if row is None:
+        return None
+    fresh = model_version is not None and row[2] == model_version
+    emb = np.array(row[1], dtype=np.float32) if fresh else None
+    return row[0], emb
+
+def store_cached(conn, key, features, embedding, model_version):
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO AnalysisCache(text_hash,features,embedding,model_version) VALUES(%s,%s,%s,%s) "
+        "ON CONFLICT (text_hash) DO UPDATE SET features=EXCLUDED.features, "
+        "embedding=EXCLUDED.embedding, model_version=EXCLUDED.model_version",
+        (key, json.dumps(features), [float(x) for x in embedding], model_version)
+    )
+    conn.commit(); cur.close()
@@ -0,0 +1,41 @@
+import os
+import threading
+
+import pytest
+
+pytest.importorskip("transformers")
+pytest.importorskip("sentence_transformers")
+
+import model_registry
+from model_registry import publish, current_version, list_versions
+
+
+@pytest.fixture
+def bundle_dir(tmp_path):
+    src = tmp_path / "trained"
+    src.mkdir()
+    (src / "config.json").write_text('{"dim": 384}')
+    (src / "weights.bin").write_bytes(os.urandom(4096))
+    return str(src)
+
+
+def test_republishing_same_content_reuses_version(tmp_path, bundle_dir):
+    root = str(tmp_path / "models")
+    first = publish(bundle_dir, root)
+    assert publish(bundle_dir, root) == first
+    assert list_versions(root) == [first]
+    assert current_version(root) == first
+
+
+def test_concurrent_bootstrap_publishes_once(tmp_path, bundle_dir, monkeypatch):
+    root = str(tmp_path / "models")
+    monkeypatch.setattr(model_registry, "LEGACY_MODEL_DIR", bundle_dir)
+    seen = []
+    threads = [threading.Thread(target=lambda: seen.append(current_version(root))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(set(seen)) == 1
+    assert list_versions(root) == seen[:1]
+    assert not os.path.exists(os.path.join(root, model_registry.LOCK_FILE))
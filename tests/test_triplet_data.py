@@ -0,0 +1,92 @@
+import random
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+pytest.importorskip("torch")
+pytest.importorskip("spacy")
+
+from triplet_data import AuthorIndex, TripletStream, read_essays, spool_to_parquet
+
+
+def _write_corpus(path, rows, row_group_size):
+    essays = [f"essay {i}" for i in range(len(rows))]
+    table = pa.table({"essay": essays, "authors": rows})
+    pq.write_table(table, path, row_group_size=row_group_size)
+    return str(path)
+
+
+@pytest.fixture
+def index(tmp_path):
+    # 2 row groups, one single-essay author that can't be an anchor
+    authors = [f"a{i % 7}" for i in range(40)] + ["solo"]
+    return AuthorIndex(_write_corpus(tmp_path / "essays.parquet", authors, 25))
+
+
+@pytest.mark.parametrize("nworkers", [1, 2, 3, 7])
+@pytest.mark.parametrize("max_triplets", [None, 17])
+def test_workers_cover_len_exactly(index, nworkers, max_triplets):
+    stream = TripletStream(index, max_triplets=max_triplets, seed=3)
+    shards = [stream.worker_anchors(0, wid, nworkers) for wid in range(nworkers)]
+    total = sum(len(s) for s in shards)
+    assert total == len(stream)
+    flat = [int(a) for s in shards for a in s]
+    assert len(set(flat)) == len(flat)
+
+
+def test_anchors_are_eligible_and_epochs_differ(index):
+    stream = TripletStream(index, seed=3)
+    first = stream.epoch_anchors(0)
+    assert len(first) == index.num_anchors == 40
+    assert index.num_rows - 1 not in set(first.tolist())  # "solo"
+    assert first.tolist() != stream.epoch_anchors(1).tolist()
+
+
+def test_read_essays_across_row_groups(index):
+    offsets = [0, 24, 25, 40, 24]
+    texts = read_essays(pq.ParquetFile(index.path), index, offsets)
+    assert texts == {o: f"essay {o}" for o in offsets}
+
+
+class CountingFile:
+    def __init__(self, path):
+        self.pf = pq.ParquetFile(path)
+        self.reads = 0
+
+    def read_row_group(self, *args, **kwargs):
+        self.reads += 1
+        return self.pf.read_row_group(*args, **kwargs)
+
+
+@pytest.fixture
+def spooled(tmp_path):
+    # 2,000 essays by 150 authors in random order, 40 row groups of 50
+    rng = random.Random(0)
+    rows = [f"author{rng.randrange(150)}" for _ in range(2000)]
+    src = tmp_path / "essays.csv"
+    src.write_text("essay,authors\n" + "".join(f"essay {i},{a}\n" for i, a in enumerate(rows)))
+    path = spool_to_parquet(str(src), str(tmp_path / "essays.spool.parquet"), chunk_rows=50)
+    return AuthorIndex(path)
+
+
+def test_spool_keeps_authors_contiguous(spooled):
+    for offs in spooled.by_author:
+        assert offs[-1] - offs[0] == len(offs) - 1
+
+
+def test_block_reads_few_row_groups(spooled):
+    stream = TripletStream(spooled, block_size=50, negative_groups=2, seed=1)
+    rng = random.Random(1)
+    anchors = stream.worker_anchors(0, 0, 1)
+    assert len(spooled.row_group_starts) >= 40
+    for i in range(0, len(anchors), 50):
+        block = stream.block_triplets(rng, anchors[i:i + 50])
+        for a, p, n in block:
+            assert spooled.row_author[a] == spooled.row_author[p] and a != p
+            assert spooled.row_author[a] != spooled.row_author[n]
+        anchor_groups = {spooled.locate(a)[0] for a, _, _ in block}
+        pf = CountingFile(spooled.path)
+        read_essays(pf, spooled, [o for t in block for o in t])
+        # Own groups, at most one neighbour per side, and the negative groups
+        assert pf.reads <= 3 * len(anchor_groups) + 2
@@ -1,73 +1,82 @@
-import pandas as pd
-import random
-from itertools import combinations
-import spacy
-from sentence_transformers import SentenceTransformer, InputExample, losses
+import os
+import math
+import torch
+from tqdm import tqdm
+from sentence_transformers import SentenceTransformer, losses
 from torch.utils.data import DataLoader
+from transformers import get_linear_schedule_with_warmup
+
+from triplet_data import spool_to_parquet, AuthorIndex, TripletStream
+from model_registry import publish
 
 # SETTINGS
-MAX_TRIPLETS = 5000
+DATA_PATH    = "essays.csv"            # .csv or .parquet with 'essay','authors'
+SPOOL_PATH   = "essays.spool.parquet"  # chunked copy used for random access
+CHUNK_ROWS   = 1024                    # rows per CSV chunk / Parquet row group
+MAX_TRIPLETS = None                    # per epoch; None = one per eligible essay
 EPOCHS       = 3
 BATCH_SIZE   = 16
+LEARNING_RATE = 2e-5
+WARMUP_STEPS = 100
+NUM_WORKERS  = max(1, (os.cpu_count() or 2) - 1)  # spaCy masking processes
+PREFETCH     = 4                       # batches queued ahead per worker
 MODEL_OUT    = "fine_tuned_triplet_model"
 
-# 1) Load & clean raw essays
-df = pd.read_csv("essays.csv")[['essay','authors']].dropna()
-print(f"Loaded {len(df)} essays.")
 
-# 2) spaCy pipeline for masking content words
-nlp = spacy.load("en_core_web_sm")
-CONTENT_POS = {"NOUN","VERB","PROPN","ADJ","ADV"}
-def mask_content(text: str) -> str:
-    doc = nlp(text)
-    return " ".join(
-        f"<{tok.pos_}>" if tok.pos_ in CONTENT_POS else tok.text
-        for tok in doc
-    )
+def main():
+    # 1) Spool raw essays into chunked Parquet (out-of-core, dropna per chunk)
+    spool_to_parquet(DATA_PATH, SPOOL_PATH, chunk_rows=CHUNK_ROWS)
 
-# 3) Build triplets: (anchor, positive, negative)
-by_author = {}
-for _, row in df.iterrows():
-    by_author.setdefault(row['authors'], []).append(row['essay'])
+    # 2) Index author -> row offsets; essay text stays on disk
+    index = AuthorIndex(SPOOL_PATH)
+    print(f"Indexed {index.num_rows} essays by {len(index.authors)} authors.")
 
-triplets = []
-authors = list(by_author.keys())
-for auth, essays in by_author.items():
-    if len(essays) < 2:
-        continue
-    # all same-author combinations
-    for a, p in combinations(essays, 2):
-        # pick negative from different author
-        neg_author = random.choice([x for x in authors if x != auth])
-        n = random.choice(by_author[neg_author])
-        triplets.append((a, p, n))
-        if len(triplets) >= MAX_TRIPLETS:
-            break
-    if len(triplets) >= MAX_TRIPLETS:
-        break
+    # 3) Triplets are drawn and masked on the fly in worker processes
+    train_data = TripletStream(index, max_triplets=MAX_TRIPLETS)
+    print(f"Streaming {len(train_data)} triplets per epoch.")
 
-print(f"Built {len(triplets)} triplets.")
+    # 4) Load SBERT & TripletLoss
+    model = SentenceTransformer("all-MiniLM-L6-v2")
+    # More workers than row groups would just contend for the same reads
+    num_workers = max(1, min(NUM_WORKERS, len(index.row_group_starts)))
+    train_dataloader = DataLoader(
+        train_data,
+        batch_size=BATCH_SIZE,
+        num_workers=num_workers,
+        prefetch_factor=PREFETCH,
+        persistent_workers=True,  # keeps spaCy loaded and the epoch counter advancing
+    )
+    train_loss = losses.TripletLoss(model)
 
-# 4) Wrap as InputExample with masked text
-train_samples = [
-    InputExample(
-        texts=[mask_content(a), mask_content(p), mask_content(n)]
-    ) for a, p, n in triplets
-]
+    # 5) Fine-tune with a plain loop over the streaming DataLoader. model.fit
+    # in sentence-transformers >= 3 copies the whole loader into memory first.
+    steps_per_epoch = math.ceil(len(train_data) / BATCH_SIZE)
+    optimizer = torch.optim.AdamW(model.parameters(), lr=LEARNING_RATE, weight_decay=0.01)
+    scheduler = get_linear_schedule_with_warmup(optimizer, WARMUP_STEPS, steps_per_epoch * EPOCHS)
+    model.train()
+    for epoch in range(EPOCHS):
+        bar = tqdm(train_dataloader, total=steps_per_epoch, desc=f"Epoch {epoch + 1}/{EPOCHS}")
+        for anchors, positives, negatives in bar:
+            features = [
+                {k: v.to(model.device) for k, v in model.tokenize(list(texts)).items()}
+                for texts in (anchors, positives, negatives)
+            ]
+            loss = train_loss(features, None)
+            loss.backward()
+            torch.nn.utils.clip_grad_norm_(model.parameters(), 1.0)
+            optimizer.step()
+            scheduler.step()
+            optimizer.zero_grad()
+            bar.set_postfix(loss=f"{loss.item():.4f}")
 
-# 5) Load SBERT & TripletLoss
-model = SentenceTransformer("all-MiniLM-L6-v2")
-train_dataloader = DataLoader(train_samples, shuffle=True, batch_size=BATCH_SIZE)
-train_loss = losses.TripletLoss(model)
+    model.save(MODEL_OUT)
+    print(f"Triplet-trained model saved to '{MODEL_OUT}'")
 
-# 6) Fine-tune
-model.fit(
-    train_objectives=[(train_dataloader, train_loss)],
-    epochs=EPOCHS,
-    warmup_steps=100,
-    output_path=MODEL_OUT,
-    show_progress_bar=True
-)
+    # 6) Publish as a new registry version; running servers hot-swap to it
+    version = publish(MODEL_OUT)
+    print(f"Published model version '{version}'")
 
-print(f"Triplet-trained model saved to '{MODEL_OUT}'")
 
+# Guarded so DataLoader workers can import this module without retraining
+if __name__ == "__main__":
+    main()
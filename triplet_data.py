@@ -0,0 +1,257 @@
+# triplet_data.py
+#
+# Out-of-core training data for train.py. The raw corpus (CSV or Parquet with
+# 'essay' and 'authors' columns) is spooled once into a Parquet file with fixed
+# size row groups and each author's essays stored contiguously, an author ->
+# row-offset index is built from the 'authors' column only, and triplets are
+# drawn and masked on the fly inside DataLoader worker processes. Positives come
+# from the anchor's own (or an adjacent) row group and negatives from a few row
+# groups sampled per block, so a block touches a handful of row groups rather
+# than the whole corpus. Only the index and one block of essays live in memory.
+
+import os
+import math
+import random
+import bisect
+import shutil
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from torch.utils.data import IterableDataset, get_worker_info
+
+from masking import nlp, mask_doc
+
+COLUMNS = ["essay", "authors"]
+# Spools written before author clustering are rebuilt
+SPOOL_FORMAT = b"author-clustered-1"
+# Source bytes per hash bucket; one bucket is sorted in memory at a time
+BUCKET_BYTES = 256 << 20
+# Only the tagger is needed for pos_; parser/ner/lemmatizer are dead weight here
+SPACY_DISABLE = ["parser", "ner", "lemmatizer"]
+
+# ——————————————
+# Spooling
+# ——————————————
+def _iter_source_chunks(src, chunk_rows):
+    if src.endswith(".parquet"):
+        for batch in pq.ParquetFile(src).iter_batches(batch_size=chunk_rows, columns=COLUMNS):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(src, usecols=COLUMNS, chunksize=chunk_rows)
+
+
+def _spool_is_current(src, dst):
+    if not os.path.exists(dst) or os.path.getmtime(dst) < os.path.getmtime(src):
+        return False
+    meta = pq.read_schema(dst).metadata or {}
+    return meta.get(b"styloguard_spool") == SPOOL_FORMAT
+
+def spool_to_parquet(src, dst, chunk_rows=1024):
+    # Two passes with at most one bucket in memory: rows are hash-partitioned
+    # by author into bucket files, then each bucket is sorted by author and
+    # appended, so every author's essays end up contiguous in the spool.
+    if _spool_is_current(src, dst):
+        return dst
+    n_buckets = max(1, math.ceil(os.path.getsize(src) / BUCKET_BYTES))
+    schema = pa.schema(
+        [("essay", pa.string()), ("authors", pa.string())],
+        metadata={b"styloguard_spool": SPOOL_FORMAT},
+    )
+    tmp = dst + ".tmp"
+    bucket_dir = dst + ".buckets"
+    shutil.rmtree(bucket_dir, ignore_errors=True)
+    os.makedirs(bucket_dir)
+    writers = {}
+    try:
+        for chunk in _iter_source_chunks(src, chunk_rows):
+            chunk = chunk[COLUMNS].dropna().astype(str)
+            if not len(chunk):
+                continue
+            keys = pd.util.hash_pandas_object(chunk["authors"], index=False).to_numpy() % n_buckets
+            for b, part in chunk.groupby(keys):
+                if b not in writers:
+                    writers[b] = pq.ParquetWriter(os.path.join(bucket_dir, f"{b}.parquet"), schema)
+                writers[b].write_table(pa.Table.from_pandas(part, schema=schema, preserve_index=False))
+        for w in writers.values():
+            w.close()
+        with pq.ParquetWriter(tmp, schema) as writer:
+            for b in sorted(writers):
+                part = pq.read_table(os.path.join(bucket_dir, f"{b}.parquet")).to_pandas()
+                part = part.sort_values("authors", kind="stable")
+                writer.write_table(
+                    pa.Table.from_pandas(part, schema=schema, preserve_index=False),
+                    row_group_size=chunk_rows,
+                )
+        os.replace(tmp, dst)
+    finally:
+        for w in writers.values():
+            w.close()
+        shutil.rmtree(bucket_dir, ignore_errors=True)
+    return dst
+
+# ——————————————
+# Author -> row-offset index
+# ——————————————
+class AuthorIndex:
+    def __init__(self, path):
+        self.path = path
+        pf = pq.ParquetFile(path)
+        self.row_group_starts = []
+        codes = {}
+        parts = {}
+        row_author = []
+        start = 0
+        for rg in range(pf.num_row_groups):
+            self.row_group_starts.append(start)
+            authors = pf.read_row_group(rg, columns=["authors"]).column(0).to_pandas()
+            rg_codes = np.empty(len(authors), dtype=np.int32)
+            for auth, idx in authors.groupby(authors).indices.items():
+                code = codes.setdefault(auth, len(codes))
+                rg_codes[idx] = code
+                parts.setdefault(code, []).append(idx.astype(np.int64) + start)
+            row_author.append(rg_codes)
+            start += len(authors)
+        self.num_rows = start
+        self.authors = list(codes)
+        # author code -> sorted row offsets, and row offset -> author code
+        self.by_author = [np.concatenate(parts[c]) for c in range(len(codes))]
+        self.row_author = np.concatenate(row_author) if row_author else np.empty(0, dtype=np.int32)
+        # Anchors need at least one other essay by the same author
+        sizes = np.array([len(o) for o in self.by_author], dtype=np.int64)
+        self.eligible = sizes[self.row_author] >= 2 if self.num_rows else np.zeros(0, dtype=bool)
+        self.num_anchors = int(self.eligible.sum())
+
+    def locate(self, offset):
+        rg = bisect.bisect_right(self.row_group_starts, offset) - 1
+        return rg, offset - self.row_group_starts[rg]
+
+    def row_group_range(self, rg):
+        starts = self.row_group_starts
+        return starts[rg], starts[rg + 1] if rg + 1 < len(starts) else self.num_rows
+
+def read_essays(pf, index, offsets):
+    # offset -> essay text, reading each touched row group once
+    wanted = {}
+    for off in set(offsets):
+        rg, pos = index.locate(off)
+        wanted.setdefault(rg, []).append((pos, off))
+    texts = {}
+    for rg, items in wanted.items():
+        col = pf.read_row_group(rg, columns=["essay"]).column(0)
+        picked = col.take(pa.array([p for p, _ in items])).to_pylist()
+        for (_, off), text in zip(items, picked):
+            texts[off] = text
+    return texts
+
+# ——————————————
+# Streaming triplet dataset
+# ——————————————
+class TripletStream(IterableDataset):
+    def __init__(self, index, max_triplets=None, block_size=256, negative_groups=2, seed=None):
+        self.index = index
+        self.max_triplets = max_triplets
+        self.block_size = block_size
+        # Row groups (besides the anchors' own) that negatives are drawn from per block
+        self.negative_groups = negative_groups
+        self.seed = seed if seed is not None else random.randrange(2**32)
+        self.epoch = 0
+
+    def __len__(self):
+        # No negatives can be drawn from a single-author corpus
+        n = self.index.num_anchors if len(self.index.authors) >= 2 else 0
+        return min(n, self.max_triplets) if self.max_triplets else n
+
+    def _rows_between(self, offs, first_rg, last_rg):
+        # Slice of the sorted offsets array that falls in row groups first_rg..last_rg
+        n = len(self.index.row_group_starts)
+        lo = self.index.row_group_range(max(first_rg, 0))[0]
+        hi = self.index.row_group_range(min(last_rg, n - 1))[1]
+        return offs[np.searchsorted(offs, lo):np.searchsorted(offs, hi)]
+
+    def _positive(self, rng, anchor, auth):
+        same = self.index.by_author[auth]
+        rg = self.index.locate(anchor)[0]
+        # Authors are contiguous in the spool, so another essay is in the
+        # anchor's row group or, at a group boundary, the adjacent one
+        for first, last in ((rg, rg), (rg - 1, rg + 1), (0, len(self.index.row_group_starts) - 1)):
+            cand = self._rows_between(same, first, last)
+            if len(cand) >= 2:
+                break
+        pos = anchor
+        while pos == anchor:
+            pos = int(cand[rng.randrange(len(cand))])
+        return pos
+
+    def _negative(self, rng, auth, ranges):
+        for _ in range(32):
+            lo, hi = ranges[rng.randrange(len(ranges))]
+            row = rng.randrange(lo, hi)
+            if self.index.row_author[row] != auth:
+                return row
+        # Resident groups hold only this author; draw from anywhere
+        neg_auth = auth
+        while neg_auth == auth:
+            neg_auth = rng.randrange(len(self.index.authors))
+        negs = self.index.by_author[neg_auth]
+        return int(negs[rng.randrange(len(negs))])
+
+    def block_triplets(self, rng, anchors):
+        # Triplets for one block; partners come from the anchors' own row groups
+        # and negative_groups other groups, which bounds the reads per block
+        anchor_groups = sorted({self.index.locate(int(a))[0] for a in anchors})
+        others = [g for g in range(len(self.index.row_group_starts)) if g not in set(anchor_groups)]
+        neg_groups = anchor_groups + rng.sample(others, min(self.negative_groups, len(others)))
+        ranges = [self.index.row_group_range(g) for g in neg_groups]
+        triplets = []
+        for a in anchors:
+            a = int(a)
+            auth = int(self.index.row_author[a])
+            triplets.append((a, self._positive(rng, a, auth), self._negative(rng, auth, ranges)))
+        return triplets
+
+    def epoch_anchors(self, epoch):
+        # Eligible anchors for one epoch: row groups in shuffled order, anchors
+        # shuffled within each group, capped at len(self). Same on every worker.
+        rng = np.random.default_rng([self.seed, epoch])
+        order = rng.permutation(len(self.index.row_group_starts))
+        parts = []
+        for rg in order:
+            start, end = self.index.row_group_range(rg)
+            offs = np.flatnonzero(self.index.eligible[start:end]) + start
+            rng.shuffle(offs)
+            parts.append(offs)
+        anchors = np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+        return anchors[:len(self)]
+
+    def worker_anchors(self, epoch, wid, nworkers):
+        # Contiguous slices keep row-group locality and add up to exactly len(self)
+        anchors = self.epoch_anchors(epoch)
+        lo = len(anchors) * wid // nworkers
+        hi = len(anchors) * (wid + 1) // nworkers
+        return anchors[lo:hi]
+
+    def __iter__(self):
+        info = get_worker_info()
+        wid, nworkers = (info.id, info.num_workers) if info else (0, 1)
+        epoch = self.epoch
+        self.epoch += 1
+        if len(self.index.authors) < 2:
+            return
+        rng = random.Random(f"{self.seed}-{epoch}-{wid}")
+
+        pf = pq.ParquetFile(self.index.path)
+        anchors = self.worker_anchors(epoch, wid, nworkers)
+        for i in range(0, len(anchors), self.block_size):
+            yield from self._emit(pf, self.block_triplets(rng, anchors[i:i + self.block_size]))
+
+    def _emit(self, pf, block):
+        # An essay can appear in several triplets of a block; mask it once
+        uniq = list(dict.fromkeys(o for t in block for o in t))
+        found = read_essays(pf, self.index, uniq)
+        texts = [found[o] for o in uniq]
+        masked = dict(zip(uniq, (mask_doc(doc) for doc in nlp.pipe(texts, batch_size=32, disable=SPACY_DISABLE))))
+        for a, p, n in block:
+            # Plain (anchor, positive, negative) tuples; default_collate batches them
+            yield masked[a], masked[p], masked[n]